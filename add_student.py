@@ -1,9 +1,8 @@
 import cv2
-from models.insightface_model import load_model
-from utils import load_embeddings, save_embeddings, save_student_to_csv
+from models.insightface_model import load_model, align_face
+from utils import add_student_to_embeddings, save_student_to_csv, save_face_crop
 
 model = load_model()
-db = load_embeddings()
 
 student_id = input("Enter Student ID: ")
 name = input("Enter Name: ")
@@ -16,10 +15,8 @@ if len(faces) == 0:
     print("No face detected")
 else:
     embedding = faces[0].embedding
-    db[student_id] = {
-        "name": name,
-        "embedding": embedding
-    }
-    save_embeddings(db)
+    add_student_to_embeddings(student_id, name, embedding)
     save_student_to_csv(student_id, name)
+    # keep the aligned crop so a model upgrade can re-embed without the photo
+    save_face_crop(student_id, align_face(img, faces[0].kps))
     print("Student added successfully")
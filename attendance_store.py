@@ -0,0 +1,143 @@
+import csv
+import io
+import os
+import threading
+import time
+from datetime import datetime
+
+from utils import file_lock
+
+DEFAULT_CLASS = "default"
+
+
+def _file_identity(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_dev, st.st_ino)
+
+
+class AttendanceSession:
+    """Attendance for one class on one date, deduplicated in memory.
+
+    Rows are appended to the attendance CSV as
+    [student_id, name, time, date, class]; the first three columns are the
+    original format, so older readers keep working. The set of marked
+    students is rebuilt from the CSV when the session is opened, so a
+    restart mid-class doesn't re-mark anyone. Rows in the original
+    three-column format have no date or class and belong to no session.
+
+    Repeat sightings are rejected from memory without reading the CSV. Only
+    a student not yet marked by this process takes the file lock, catches up
+    on rows other workers appended since the last read, and then appends.
+    Clearing replaces the file, which every worker notices through a
+    throttled stat of the file identity before trusting its index.
+    """
+
+    # Seconds between checks for the CSV having been cleared by another worker
+    IDENTITY_CHECK_INTERVAL = 1.0
+
+    def __init__(self, csv_path, class_name=DEFAULT_CLASS, date=None):
+        self.csv_path = csv_path
+        self.lock_path = csv_path + ".lock"
+        self.class_name = class_name
+        self.date = date or datetime.now().strftime("%Y-%m-%d")
+        self._marked = set()
+        self._offset = 0
+        self._identity = None
+        self._identity_checked = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    @property
+    def marked_count(self):
+        return len(self._marked)
+
+    def is_marked(self, student_id):
+        return student_id in self._marked
+
+    def reload(self):
+        """Rebuild the index from this session's rows in the CSV"""
+        with self._lock, file_lock(self.lock_path):
+            self._reset()
+            self._catch_up()
+
+    def clear(self, backup_path):
+        """Move the CSV to backup_path and start an empty one, for every worker"""
+        with self._lock, file_lock(self.lock_path):
+            if os.path.exists(self.csv_path):
+                os.rename(self.csv_path, backup_path)
+            # Don't write header as original file didn't have one
+            open(self.csv_path, "w", newline="", encoding="utf-8").close()
+            self._reset()
+            self._catch_up()
+
+    def _reset(self):
+        self._marked = set()
+        self._offset = 0
+        self._identity = None
+
+    def _check_identity(self):
+        # Cheap, throttled stat so the frame loop notices a clear by another worker
+        now = time.monotonic()
+        if now - self._identity_checked < self.IDENTITY_CHECK_INTERVAL:
+            return
+        self._identity_checked = now
+        if _file_identity(self.csv_path) != self._identity:
+            with self._lock:
+                self._catch_up()
+
+    def _catch_up(self):
+        # Read only what was appended since the last read
+        identity = _file_identity(self.csv_path)
+        if identity is None:
+            self._reset()
+            return
+
+        if identity != self._identity or os.path.getsize(self.csv_path) < self._offset:
+            # File was cleared/rotated underneath us
+            self._reset()
+            self._identity = identity
+
+        with open(self.csv_path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+
+        # Ignore a trailing partial line, it will be picked up next time
+        end = data.rfind(b"\n") + 1
+        self._offset += end
+
+        reader = csv.reader(io.StringIO(data[:end].decode("utf-8")))
+        for row in reader:
+            if len(row) >= 5 and row[3] == self.date and row[4] == self.class_name:
+                self._marked.add(row[0])
+
+    def mark(self, student_id, name):
+        """Record attendance once per session; returns False for duplicates"""
+        self._check_identity()
+        if student_id in self._marked:
+            return False
+
+        with self._lock, file_lock(self.lock_path):
+            self._catch_up()
+            if student_id in self._marked:
+                return False
+
+            os.makedirs(os.path.dirname(self.csv_path) or ".", exist_ok=True)
+            time_now = datetime.now().strftime("%H:%M:%S")
+            with open(self.csv_path, "a", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow([student_id, name, time_now, self.date, self.class_name])
+
+            self._marked.add(student_id)
+            self._identity = _file_identity(self.csv_path)
+            self._offset = os.path.getsize(self.csv_path)
+            return True
+
+    def to_dict(self):
+        return {
+            "class": self.class_name,
+            "date": self.date,
+            "marked_count": self.marked_count
+        }
@@ -1,28 +1,50 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, WebSocket
 from fastapi.responses import JSONResponse
+import asyncio
 import logging
 import uvicorn
-from recognize_attendance import recognize_face
+from recognize_attendance import recognize_face, recognize_faces, refresh_embeddings
+from result_cache import ResultCache, hash_image_bytes
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Result cache for repeated submissions of the same image
+CACHE_MAX_ENTRIES = 256
+CACHE_TTL_SECONDS = 300
+
+# A student must be matched on this many consecutive frames of a stream
+# before a match event is pushed (filters single-frame misidentifications)
+STREAM_CONFIRM_FRAMES = 2
+
 app = FastAPI(title="Face Recognition Service")
+result_cache = ResultCache(max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS)
 
 @app.post("/recognize")
 async def recognize(image: UploadFile = File(...)):
     try:
         # Read file as bytes
         image_bytes = await image.read()
-        
+
+        # Retries/re-renders often resubmit the exact same photo
+        key = hash_image_bytes(image_bytes)
+        generation = refresh_embeddings()
+        cached = result_cache.get(key, generation)
+        if cached is not None:
+            return JSONResponse(content=cached)
+
         # Call the logic
-        # Note: recognize_face is synchronous. 
-        # For high load, might want to run in threadpool, but for now simple call is fine.
-        result = recognize_face(image_bytes)
-        
+        # recognize_face is synchronous; run it off the event loop so open
+        # /ws/recognize streams keep being served meanwhile
+        result = await asyncio.to_thread(recognize_face, image_bytes)
+
+        # Never cache errors, they may be transient
+        if result.get("status") == "success":
+            result_cache.put(key, generation, result)
+
         return JSONResponse(content=result)
-        
+
     except Exception as e:
         logger.error(f"Error processing image: {e}")
         # Return 500 but also the error message structure
@@ -31,5 +53,137 @@ async def recognize(image: UploadFile = File(...)):
             content={"status": "error", "message": str(e)}
         )
 
+class StreamSession:
+    """Per-connection state for the streaming recognition endpoint"""
+
+    def __init__(self):
+        self.marked = set()
+        self.tracks = {}  # student_id -> consecutive frames matched
+        self.frames_received = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+
+    def update(self, faces):
+        """Update tracks with one frame's faces and return new match events"""
+        events = []
+        seen = set()
+
+        for face in faces:
+            if not face["match"]:
+                continue
+            sid = face["student_id"]
+            seen.add(sid)
+            self.tracks[sid] = self.tracks.get(sid, 0) + 1
+
+            if sid not in self.marked and self.tracks[sid] >= STREAM_CONFIRM_FRAMES:
+                self.marked.add(sid)
+                events.append({
+                    "type": "match",
+                    "student_id": sid,
+                    "name": face["name"],
+                    "confidence": face["confidence"]
+                })
+
+        # Students who left the frame have to be re-confirmed
+        for sid in list(self.tracks):
+            if sid not in seen:
+                del self.tracks[sid]
+
+        return events
+
+    def stats(self):
+        return {
+            "type": "stats",
+            "frames_received": self.frames_received,
+            "frames_processed": self.frames_processed,
+            "frames_dropped": self.frames_dropped,
+            "marked": sorted(self.marked)
+        }
+
+@app.websocket("/ws/recognize")
+async def recognize_stream(websocket: WebSocket):
+    """Continuous recognition over one connection.
+
+    Clients send JPEG frames as binary messages. Only the newest frame is
+    kept while a previous one is being processed, so a slow server drops
+    stale frames instead of building up latency. A text message "stats"
+    returns the session counters.
+    """
+    await websocket.accept()
+    session = StreamSession()
+    latest = {"frame": None, "closed": False, "stats": False}
+    frame_ready = asyncio.Event()
+
+    async def receive_frames():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is not None:
+                    session.frames_received += 1
+                    if latest["frame"] is not None:
+                        session.frames_dropped += 1
+                    latest["frame"] = message["bytes"]
+                    frame_ready.set()
+                elif message.get("text") == "stats":
+                    # Replied from the main loop, the only task that sends
+                    latest["stats"] = True
+                    frame_ready.set()
+        finally:
+            latest["closed"] = True
+            frame_ready.set()
+
+    receiver = asyncio.create_task(receive_frames())
+
+    try:
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            if latest["closed"]:
+                break
+
+            if latest["stats"]:
+                latest["stats"] = False
+                await websocket.send_json(session.stats())
+
+            frame_bytes = latest["frame"]
+            latest["frame"] = None
+            if frame_bytes is None:
+                continue
+
+            # Run the model off the event loop so frames keep being received
+            result = await asyncio.to_thread(recognize_faces, frame_bytes)
+            session.frames_processed += 1
+
+            if result.get("status") != "success":
+                await websocket.send_json({"type": "error", "message": result.get("message")})
+                continue
+
+            for event in session.update(result["faces"]):
+                await websocket.send_json(event)
+            await websocket.send_json({
+                "type": "frame",
+                "faces": result["faces"],
+                "dropped": session.frames_dropped
+            })
+
+    except Exception as e:
+        # Client went away mid-send or recognition blew up
+        logger.info(f"Stream closed: {e}")
+    finally:
+        receiver.cancel()
+        try:
+            await receiver
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.info(f"Stream receive failed: {e}")
+        logger.info(f"Stream session ended: {session.stats()}")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return JSONResponse(content=result_cache.stats())
+
 if __name__ == '__main__':
     uvicorn.run(app, host="127.0.0.1", port=5001)
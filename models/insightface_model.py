@@ -1,11 +1,30 @@
 # models/insightface_model.py
+import os
 from insightface.app import FaceAnalysis
+from insightface.utils import face_align
 
-def load_model():
-    app = FaceAnalysis(name="buffalo_l")
+# model pack used everywhere; after changing it, rebuild the gallery with reembed_students.py
+MODEL_PACK = os.environ.get("FACE_MODEL_PACK", "buffalo_l")
+
+def load_model(name=MODEL_PACK):
+    app = FaceAnalysis(name=name)
     try:
         # try GPU (ctx_id=0), fall back to CPU (ctx_id=-1) if unavailable
         app.prepare(ctx_id=0, det_size=(640, 640))
     except Exception:
         app.prepare(ctx_id=-1, det_size=(640, 640))
     return app
+
+def detect_faces(app, img):
+    # detection only: returns bboxes (N, 5) and keypoints (N, 5, 2)
+    return app.det_model.detect(img, max_num=0, metric="default")
+
+def align_face(img, kps):
+    # same 112x112 crop FaceAnalysis.get() feeds to the recognition model
+    return face_align.norm_crop(img, landmark=kps, image_size=112)
+
+def embed_crops(app, crops):
+    # run only the recognition model over many aligned crops in one batch
+    if len(crops) == 0:
+        return []
+    return app.models["recognition"].get_feat(crops)
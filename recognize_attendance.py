@@ -1,7 +1,7 @@
 import cv2
 
 from models.insightface_model import load_model
-from utils import load_embeddings, cosine_similarity
+from utils import load_embeddings, cosine_similarity, get_gallery_generation
 
 THRESHOLD = 0.5
 
@@ -10,9 +10,64 @@ import numpy as np
 # Load model and db at module level
 model = load_model()
 db = load_embeddings()
+db_generation = get_gallery_generation()
+
+def refresh_embeddings():
+    """Reload embeddings if the database changed on disk; returns its generation"""
+    global db, db_generation
+    generation = get_gallery_generation()
+    if generation != db_generation:
+        db = load_embeddings()
+        db_generation = generation
+    return db_generation
+
+def match_embedding(emb):
+    """Return (student_id, name, score) of the closest gallery entry"""
+    gallery = db
+    best_match = None
+    best_score = 0
+
+    for sid, data in gallery.items():
+        score = cosine_similarity(emb, data["embedding"])
+        if score > best_score:
+            best_score = score
+            best_match = sid
+
+    name = gallery[best_match]["name"] if best_match is not None else None
+    return best_match, name, best_score
+
+def recognize_faces(image_bytes):
+    """Recognize every face in the image (used by the streaming endpoint)"""
+    try:
+        refresh_embeddings()
+
+        nparr = np.frombuffer(image_bytes, np.uint8)
+        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+        if frame is None:
+            return {"status": "error", "message": "Failed to decode image"}
+
+        results = []
+        for face in model.get(frame):
+            best_match, name, best_score = match_embedding(face.embedding)
+            matched = best_score > THRESHOLD
+            results.append({
+                "bbox": [int(v) for v in face.bbox],
+                "match": matched,
+                "student_id": best_match if matched else None,
+                "name": name if matched else None,
+                "confidence": float(best_score)
+            })
+
+        return {"status": "success", "faces": results}
+
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
 
 def recognize_face(image_bytes):
     try:
+        refresh_embeddings()
+
         # Convert bytes to numpy array
         nparr = np.frombuffer(image_bytes, np.uint8)
         frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
@@ -27,18 +82,9 @@ def recognize_face(image_bytes):
         # Process the largest face if multiple
         face = sorted(faces, key=lambda x: (x.bbox[2]-x.bbox[0]) * (x.bbox[3]-x.bbox[1]), reverse=True)[0]
         
-        emb = face.embedding
-        best_match = None
-        best_score = 0
-
-        for sid, data in db.items():
-            score = cosine_similarity(emb, data["embedding"])
-            if score > best_score:
-                best_score = score
-                best_match = sid
+        best_match, name, best_score = match_embedding(face.embedding)
 
         if best_score > THRESHOLD:
-            name = db[best_match]["name"]
             # Optional: Mark attendance here if desired, or let caller handle it
             # time_now = datetime.now().strftime("%H:%M:%S")
             # We will just return the data
@@ -0,0 +1,106 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from models.insightface_model import MODEL_PACK, load_model, embed_crops
+from utils import (
+    DB_PATH,
+    GALLERY_LOCK_PATH,
+    file_lock,
+    load_embeddings,
+    save_embeddings,
+    switch_gallery,
+    iter_face_crops,
+    load_face_crop
+)
+
+parser = argparse.ArgumentParser(
+    description="Rebuild the embeddings database from archived face crops (e.g. after a model change)"
+)
+parser.add_argument("--model", default=MODEL_PACK, help="InsightFace model pack to embed with")
+parser.add_argument("--batch-size", type=int, default=256, help="Crops per recognition batch")
+parser.add_argument("--no-switch", action="store_true", help="Only build the new gallery version, don't make it live")
+parser.add_argument("--force", action="store_true", help="Switch even if some students have no archived crop")
+args = parser.parse_args()
+
+# The services embed faces with MODEL_PACK; a live gallery from any other
+# pack would make every match meaningless
+if args.model != MODEL_PACK and not args.no_switch:
+    print(f"--model {args.model} differs from FACE_MODEL_PACK ({MODEL_PACK}) used by the services.")
+    print(f"Set FACE_MODEL_PACK={args.model} for this job and the services, or use --no-switch.")
+    sys.exit(1)
+
+model = load_model(args.model)
+db = load_embeddings()
+
+start = time.time()
+new_db = {}
+batch_ids = []
+batch_crops = []
+
+def flush():
+    # run only the recognition model over the whole batch
+    for sid, emb in zip(batch_ids, embed_crops(model, batch_crops)):
+        new_db[sid] = {"name": db[sid]["name"], "embedding": emb}
+    batch_ids.clear()
+    batch_crops.clear()
+
+for sid, crop in iter_face_crops():
+    if sid not in db or crop is None:
+        continue
+    batch_ids.append(sid)
+    batch_crops.append(crop)
+    if len(batch_crops) >= args.batch_size:
+        flush()
+        print(f"Re-embedded {len(new_db)}/{len(db)} students")
+flush()
+
+print(f"Re-embedded {len(new_db)} students in {time.time() - start:.1f}s")
+
+# Enrollment takes the same lock, so the live gallery can't change between
+# reconciling against it and switching
+with file_lock(GALLERY_LOCK_PATH):
+    live = load_embeddings()
+
+    # Students removed while the job ran
+    for sid in set(new_db) - set(live):
+        del new_db[sid]
+
+    # Students enrolled or re-enrolled while the job ran
+    changed = [
+        sid for sid in live
+        if sid not in db or not np.array_equal(live[sid]["embedding"], db[sid]["embedding"])
+    ]
+    db = live
+    for sid in changed:
+        new_db.pop(sid, None)
+        crop = load_face_crop(sid)
+        if crop is not None:
+            batch_ids.append(sid)
+            batch_crops.append(crop)
+    flush()
+    if changed:
+        print(f"Reconciled {len(changed)} students enrolled while the job ran")
+
+    # Build the new version side by side with the live gallery; the pack is
+    # part of the name so it's clear which model produced it
+    version_path = os.path.join(
+        os.path.dirname(DB_PATH), f"embeddings_{args.model}_{time.strftime('%Y%m%d_%H%M%S')}.pkl"
+    )
+    save_embeddings(new_db, path=version_path)
+    print(f"New gallery version written to {version_path}")
+
+    missing = sorted(set(live) - set(new_db))
+    if missing:
+        print(f"{len(missing)} students have no archived crop and must be re-enrolled: {', '.join(missing)}")
+
+    if args.no_switch:
+        print("Live gallery left unchanged (--no-switch)")
+    elif missing and not args.force:
+        print("Live gallery left unchanged; use --force to switch without these students")
+    else:
+        switch_gallery(version_path)
+        print(f"Switched live gallery to {version_path}")
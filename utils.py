@@ -2,9 +2,44 @@ import pickle
 import numpy as np
 import os
 import csv
+import shutil
+import zipfile
+from contextlib import contextmanager
+import cv2
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 DB_PATH = "database/embeddings.pkl"
 CSV_PATH = "database/students.csv"
+CROPS_PATH = "database/face_crops.zip"
+
+# Held across read-modify-write of the gallery / crop archive, so concurrent
+# enrollments (threaded Flask, CLI scripts, re-embedding) don't lose updates
+GALLERY_LOCK_PATH = DB_PATH + ".lock"
+CROPS_LOCK_PATH = CROPS_PATH + ".lock"
+
+@contextmanager
+def file_lock(lock_path):
+    """Exclusive lock shared by every thread and process using lock_path"""
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+    with open(lock_path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
 
 def load_embeddings():
     # Ensure database folder exists
@@ -20,10 +55,22 @@ def load_embeddings():
         except (EOFError, pickle.UnpicklingError):
             return {}
 
-def save_embeddings(data):
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    with open(DB_PATH, "wb") as f:
+def get_gallery_generation():
+    # Changes whenever the embeddings file is rewritten (student added/removed).
+    # Writes go through os.replace, so every rewrite is a new inode even when
+    # size and mtime tick happen to match the previous version.
+    if not os.path.exists(DB_PATH):
+        return None
+    st = os.stat(DB_PATH)
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def save_embeddings(data, path=DB_PATH):
+    # write next to the target and rename, so readers never see a partial file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
         pickle.dump(data, f)
+    os.replace(tmp_path, path)
 
 def save_student_to_csv(student_id, name):
     os.makedirs(os.path.dirname(CSV_PATH), exist_ok=True)
@@ -39,17 +86,113 @@ def save_student_to_csv(student_id, name):
 
         writer.writerow([student_id, name])
 
+def switch_gallery(version_path):
+    # atomically make a gallery version built side by side the live one
+    tmp_path = DB_PATH + ".tmp"
+    shutil.copyfile(version_path, tmp_path)
+    os.replace(tmp_path, DB_PATH)
+
+def _rewrite_face_crops(exclude):
+    # zip entries can't be deleted in place; copy the archive without them
+    tmp_path = CROPS_PATH + ".tmp"
+    with zipfile.ZipFile(CROPS_PATH, "r") as src, zipfile.ZipFile(tmp_path, "w") as dst:
+        for info in src.infolist():
+            if info.filename not in exclude:
+                dst.writestr(info, src.read(info))
+    os.replace(tmp_path, CROPS_PATH)
+
+def _crop_entry(student_id):
+    return f"{student_id}.png"
+
+def iter_face_crops():
+    # yields (student_id, aligned 112x112 face crop) without loading the whole archive
+    if not os.path.exists(CROPS_PATH) or os.path.getsize(CROPS_PATH) == 0:
+        return
+
+    with zipfile.ZipFile(CROPS_PATH, "r") as archive:
+        for name in archive.namelist():
+            data = archive.read(name)
+            crop = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            yield name[:-len(".png")], crop
+
+def save_face_crop(student_id, crop):
+    # PNG keeps the crop lossless so re-embedding sees exactly what enrollment saw;
+    # the zip is appended to, so enrollment cost doesn't grow with the archive.
+    # Best effort: the crop is only needed for re-embedding, so a failure here
+    # is reported but never blocks enrollment.
+    try:
+        ok, buffer = cv2.imencode(".png", crop)
+        if not ok:
+            raise ValueError("could not encode crop")
+
+        os.makedirs(os.path.dirname(CROPS_PATH), exist_ok=True)
+        entry = _crop_entry(student_id)
+        with file_lock(CROPS_LOCK_PATH):
+            if os.path.exists(CROPS_PATH):
+                with zipfile.ZipFile(CROPS_PATH, "r") as archive:
+                    exists = entry in archive.namelist()
+                if exists:
+                    # re-enrollment replaces the old crop
+                    _rewrite_face_crops({entry})
+
+            with zipfile.ZipFile(CROPS_PATH, "a", compression=zipfile.ZIP_STORED) as archive:
+                archive.writestr(entry, buffer.tobytes())
+        return True
+    except Exception as e:
+        print(f"Warning: could not archive face crop for {student_id}: {e}")
+        return False
+
+def load_face_crop(student_id):
+    # single crop, or None if the student has none archived
+    if not os.path.exists(CROPS_PATH):
+        return None
+
+    with zipfile.ZipFile(CROPS_PATH, "r") as archive:
+        try:
+            data = archive.read(_crop_entry(student_id))
+        except KeyError:
+            return None
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+def remove_face_crop(student_id):
+    try:
+        with file_lock(CROPS_LOCK_PATH):
+            if not os.path.exists(CROPS_PATH):
+                return False
+
+            entry = _crop_entry(student_id)
+            with zipfile.ZipFile(CROPS_PATH, "r") as archive:
+                if entry not in archive.namelist():
+                    return False
+
+            _rewrite_face_crops({entry})
+            return True
+    except Exception as e:
+        print(f"Warning: could not remove archived face crop for {student_id}: {e}")
+        return False
+
 def cosine_similarity(a, b):
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
+def add_student_to_embeddings(student_id, name, embedding):
+    with file_lock(GALLERY_LOCK_PATH):
+        db = load_embeddings()
+        db[student_id] = {
+            "name": name,
+            "embedding": embedding
+        }
+        save_embeddings(db)
+    return db
+
 def remove_student_from_embeddings(student_id):
-    db = load_embeddings()
+    with file_lock(GALLERY_LOCK_PATH):
+        db = load_embeddings()
 
-    if student_id not in db:
-        return False
+        if student_id not in db:
+            return False
 
-    del db[student_id]
-    save_embeddings(db)
+        del db[student_id]
+        save_embeddings(db)
     return True
 
 def remove_student_from_csv(student_id):
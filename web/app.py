@@ -13,27 +13,46 @@ import numpy as np
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
-from models.insightface_model import load_model
+from models.insightface_model import load_model, align_face
 from utils import (
     load_embeddings, 
     cosine_similarity, 
-    save_embeddings, 
+    add_student_to_embeddings,
     save_student_to_csv,
     remove_student_from_embeddings,
-    remove_student_from_csv
+    remove_student_from_csv,
+    get_gallery_generation,
+    save_face_crop,
+    remove_face_crop
 )
+from attendance_store import AttendanceSession, DEFAULT_CLASS
+from camera_sources import CameraSource, InferenceScheduler, parse_camera_sources
 
 app = Flask(__name__)
 
+# Named camera sources, e.g. CAMERA_SOURCES="front=0,back=rtsp://10.0.0.5/stream,demo=test"
+CAMERA_SOURCES = parse_camera_sources(os.environ.get("CAMERA_SOURCES", "default=0"))
+DEFAULT_CAMERA = next(iter(CAMERA_SOURCES))
+
 # Camera and face recognition globals
-camera = None
-camera_lock = threading.Lock()
+cameras = {name: CameraSource(name, source) for name, source in CAMERA_SOURCES.items()}
 is_streaming = False
 is_recognition_active = False
-marked_attendance = set()
 THRESHOLD = 0.5
 face_model = None
 embeddings_db = None
+embeddings_generation = None
+
+# Preview tiers for /api/video-feed?tier=...; width None keeps the capture resolution.
+# width/quality/fps query parameters override the tier's values.
+STREAM_TIERS = {
+    "low": {"width": 320, "quality": 50, "fps": 10},
+    "medium": {"width": 480, "quality": 70, "fps": 15},
+    "high": {"width": None, "quality": 85, "fps": 30},
+}
+DEFAULT_STREAM_TIER = "high"
+MIN_JPEG_QUALITY = 30
+MAX_STREAM_FPS = 30
 
 # Allow large file uploads (16MB max)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
@@ -58,123 +77,206 @@ CAPTURED_IMAGES_DIR = os.path.join(BASE_DIR, "captured_images")
 # Track if attendance is running
 attendance_process = None
 
+# Current attendance session (class + date); marks already in the CSV for
+# it are picked up again after a restart
+attendance_session = AttendanceSession(ATTENDANCE_CSV)
+
+
+def get_camera(name=None):
+    """Start a camera source (all sources when name is None)"""
+    if name is None:
+        for cam in cameras.values():
+            cam.start()
+        return cameras[DEFAULT_CAMERA]
+    cam = cameras.get(name)
+    if cam is not None:
+        cam.start()
+    return cam
 
-def get_camera():
-    """Initialize camera if not already initialized"""
-    global camera
-    with camera_lock:
-        if camera is None:
-            camera = cv2.VideoCapture(0)
-            camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-        return camera
 
+def release_camera(name=None):
+    """Stop a camera source (all sources when name is None)"""
+    targets = cameras.values() if name is None else [cameras[name]] if name in cameras else []
+    for cam in targets:
+        cam.stop()
 
-def release_camera():
-    """Release camera resource"""
-    global camera
-    with camera_lock:
-        if camera is not None:
-            camera.release()
-            camera = None
+
+def any_camera_running():
+    return any(cam.running for cam in cameras.values())
 
 
 def load_face_recognition():
     """Load face recognition model and embeddings"""
-    global face_model, embeddings_db
+    global face_model, embeddings_db, embeddings_generation
     if face_model is None:
         print("Loading face recognition model...")
         face_model = load_model()
-    if embeddings_db is None:
+    generation = get_gallery_generation()
+    if embeddings_db is None or generation != embeddings_generation:
+        # (Re)load embeddings in case students were added or removed
         print("Loading embeddings database...")
         embeddings_db = load_embeddings()
+        embeddings_generation = generation
     return face_model, embeddings_db
 
 
-def generate_frames():
-    """Generator function for video streaming"""
-    global is_streaming, is_recognition_active, marked_attendance, embeddings_db
-    
-    while is_streaming:
-        cam = get_camera()
-        if cam is None:
-            break
-            
-        success, frame = cam.read()
-        if not success:
-            break
-        
-        # If recognition is active, process face recognition
-        if is_recognition_active:
-            try:
-                model, db = load_face_recognition()
-                # Reload embeddings in case new students were added
-                embeddings_db = load_embeddings()
-                db = embeddings_db
-                
-                faces = model.get(frame)
-                
-                for face in faces:
-                    # Draw bounding box
-                    bbox = face.bbox.astype(int)
-                    cv2.rectangle(frame, (bbox[0], bbox[1]), (bbox[2], bbox[3]), (0, 255, 0), 2)
-                    
-                    emb = face.embedding
-                    best_match = None
-                    best_score = 0
-                    
-                    for sid, data in db.items():
-                        score = cosine_similarity(emb, data["embedding"])
-                        if score > best_score:
-                            best_score = score
-                            best_match = sid
-                    
-                    if best_score > THRESHOLD:
-                        name = db[best_match]["name"]
-                        label = f"{name} ({best_score:.2f})"
-                        color = (0, 255, 0)  # Green for recognized
-                        
-                        # Mark attendance if not already marked
-                        if best_match not in marked_attendance:
-                            time_now = datetime.now().strftime("%H:%M:%S")
-                            
-                            # Save to CSV
-                            with open(ATTENDANCE_CSV, "a", newline="", encoding="utf-8") as f:
-                                writer = csv.writer(f)
-                                writer.writerow([best_match, name, time_now])
-                            
-                            marked_attendance.add(best_match)
-                            print(f"Attendance marked: {name}")
-                    else:
-                        label = "Unknown"
-                        color = (0, 0, 255)  # Red for unknown
-                    
-                    # Draw label
-                    cv2.putText(frame, label, (bbox[0], bbox[1] - 10),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-                    
-            except Exception as e:
-                print(f"Face recognition error: {e}")
-                # Draw error message on frame
-                cv2.putText(frame, "Recognition Error", (10, 30),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-        
-        # Add status text
-        status_text = "RECORDING ATTENDANCE" if is_recognition_active else "CAMERA PREVIEW"
-        color = (0, 255, 0) if is_recognition_active else (255, 165, 0)
-        cv2.putText(frame, status_text, (10, frame.shape[0] - 10),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-        
-        # Encode frame as JPEG
-        ret, buffer = cv2.imencode('.jpg', frame)
-        if not ret:
+def mark_attendance(student_id, name):
+    """Append an attendance record once per session, whichever camera or worker saw the student"""
+    return attendance_session.mark(student_id, name)
+
+
+def get_requested_class():
+    """Class name from the request body ({"class": ...}); returns (class_name, error)"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or "class" not in data:
+        return DEFAULT_CLASS, None
+    class_name = data["class"]
+    if not isinstance(class_name, str) or not class_name.strip():
+        return None, "Class must be a non-empty string"
+    return class_name.strip(), None
+
+
+def open_attendance_session(class_name):
+    """Switch to the given class's session for today"""
+    global attendance_session
+    today = datetime.now().strftime("%Y-%m-%d")
+    if attendance_session.class_name != class_name or attendance_session.date != today:
+        attendance_session = AttendanceSession(ATTENDANCE_CSV, class_name, today)
+    return attendance_session
+
+
+def recognize_camera_face(camera_name, bbox, emb):
+    """Match one face from the shared scheduler; returns the (label, color) to draw"""
+    _, db = load_face_recognition()
+    best_match = None
+    best_score = 0
+
+    for sid, data in db.items():
+        score = cosine_similarity(emb, data["embedding"])
+        if score > best_score:
+            best_score = score
+            best_match = sid
+
+    if best_score > THRESHOLD:
+        name = db[best_match]["name"]
+        if mark_attendance(best_match, name):
+            print(f"Attendance marked: {name} (camera: {camera_name})")
+        return f"{name} ({best_score:.2f})", (0, 255, 0)  # Green for recognized
+    return "Unknown", (0, 0, 255)  # Red for unknown
+
+
+scheduler = InferenceScheduler(
+    cameras,
+    get_model=lambda: load_face_recognition()[0],
+    on_face=recognize_camera_face,
+    is_active=lambda: is_recognition_active
+)
+
+
+# Last encoded frame per (camera, width, quality), shared by viewers on the same settings
+encoded_frames = {}
+# Entries this many frames behind the newest one are dropped
+ENCODED_FRAMES_MAX_AGE = 5
+encoded_frames_lock = threading.Lock()
+
+
+def render_preview(camera_name, frame, width, buffers):
+    """Draw overlays on a (downscaled) copy of the frame, reusing the client's buffers"""
+    height, full_width = frame.shape[:2]
+    if width and width < full_width:
+        size = (width, int(height * width / full_width))
+        out = buffers.get("scaled")
+        if out is None or out.shape[1::-1] != size:
+            out = buffers["scaled"] = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        cv2.resize(frame, size, dst=out, interpolation=cv2.INTER_AREA)
+    else:
+        out = buffers.get("full")
+        if out is None or out.shape != frame.shape:
+            out = buffers["full"] = np.empty_like(frame)
+        np.copyto(out, frame)
+
+    scale = out.shape[1] / full_width
+    font_scale = max(0.4, 0.6 * scale)
+
+    # Recognition runs in the shared scheduler; just draw its latest results
+    if is_recognition_active:
+        for bbox, label, color in scheduler.annotations(camera_name):
+            x1, y1, x2, y2 = (int(v * scale) for v in bbox)
+            cv2.rectangle(out, (x1, y1), (x2, y2), color, 2)
+            cv2.putText(out, label, (x1, y1 - 10),
+                       cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, 2)
+    
+    # Add status text
+    status_text = "RECORDING ATTENDANCE" if is_recognition_active else "CAMERA PREVIEW"
+    color = (0, 255, 0) if is_recognition_active else (255, 165, 0)
+    cv2.putText(out, f"{status_text} [{camera_name}]", (10, out.shape[0] - 10),
+               cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, 2)
+    return out
+
+
+def encode_frame(camera_name, seq, frame, width, quality, buffers):
+    """JPEG-encode a frame once per (camera, width, quality) no matter how many viewers"""
+    key = (camera_name, width, quality)
+    state = (seq, is_recognition_active)
+    with encoded_frames_lock:
+        cached = encoded_frames.get(key)
+    if cached is not None and cached[0] == state:
+        return cached[1]
+
+    preview = render_preview(camera_name, frame, width, buffers)
+    ret, buffer = cv2.imencode('.jpg', preview, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ret:
+        return None
+
+    frame_bytes = buffer.tobytes()
+    with encoded_frames_lock:
+        encoded_frames[key] = (state, frame_bytes)
+        # Settings nobody is watching any more stop holding a JPEG
+        for other_key, (other_state, _) in list(encoded_frames.items()):
+            if other_key[0] == camera_name and other_state[0] < seq - ENCODED_FRAMES_MAX_AGE:
+                del encoded_frames[other_key]
+    return frame_bytes
+
+
+def generate_frames(camera_name=DEFAULT_CAMERA, width=None, quality=85, fps=30, adaptive=True):
+    """Generator function for video streaming of one camera source.
+
+    Each viewer is paced on its own: the generator only resumes once the
+    previous frame was handed to the client, then sends the newest frame,
+    so slow viewers skip frames instead of backing up. With `adaptive`, JPEG
+    quality drops while sending takes longer than the frame interval and
+    recovers when the client keeps up.
+    """
+    cam = cameras[camera_name]
+    last_seq = None
+    interval = 1.0 / fps
+    max_quality = quality
+    buffers = {}
+
+    while is_streaming and cam.running:
+        seq, frame = cam.read()
+        if frame is None or seq == last_seq:
+            time.sleep(0.005)
             continue
-            
-        frame_bytes = buffer.tobytes()
+        last_seq = seq
+        frame_started = time.time()
+
+        frame_bytes = encode_frame(camera_name, seq, frame, width, quality, buffers)
+        if frame_bytes is None:
+            continue
+
+        send_started = time.time()
         yield (b'--frame\r\n'
                b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        
-        time.sleep(0.033)  # ~30 FPS
+        send_time = time.time() - send_started
+
+        if adaptive:
+            if send_time > interval:
+                quality = max(MIN_JPEG_QUALITY, quality - 10)
+            elif send_time < interval / 4 and quality < max_quality:
+                quality = min(max_quality, quality + 5)
+
+        time.sleep(max(0.0, interval - (time.time() - frame_started)))
 
 @app.route("/")
 def index():
@@ -193,7 +295,10 @@ def get_attendance():
                     attendance.append({
                         "id": row[0],
                         "name": row[1],
-                        "time": row[2]
+                        "time": row[2],
+                        # Rows written before sessions existed have no date/class
+                        "date": row[3] if len(row) >= 5 else None,
+                        "class": row[4] if len(row) >= 5 else None
                     })
     
     return jsonify(attendance)
@@ -305,14 +410,12 @@ def register_student():
         embedding = faces[0].embedding
         
         # Load current embeddings and add new student
-        db = load_embeddings()
-        db[student_id] = {
-            "name": name,
-            "embedding": embedding
-        }
-        save_embeddings(db)
+        db = add_student_to_embeddings(student_id, name, embedding)
         save_student_to_csv(student_id, name)
         
+        # Keep the aligned crop so a model upgrade can re-embed without the photo
+        save_face_crop(student_id, align_face(img, faces[0].kps))
+        
         # Refresh the cached embeddings
         embeddings_db = db
         
@@ -351,6 +454,7 @@ def remove_student():
     try:
         removed_db = remove_student_from_embeddings(student_id)
         removed_csv = remove_student_from_csv(student_id)
+        remove_face_crop(student_id)
         
         if removed_db or removed_csv:
             # Refresh the cached embeddings
@@ -377,12 +481,16 @@ def remove_student():
 @app.route("/api/start-attendance", methods=["POST", "OPTIONS"])
 def start_attendance():
     """API endpoint to start attendance recognition on the server"""
-    global attendance_process, is_recognition_active, is_streaming, marked_attendance
+    global attendance_process, is_recognition_active, is_streaming
     
     # Handle preflight request
     if request.method == "OPTIONS":
         return jsonify({"status": "ok"}), 200
     
+    class_name, error = get_requested_class()
+    if error:
+        return jsonify({"success": False, "message": error}), 400
+    
     # Use web-based streaming
     is_streaming = True
     get_camera()
@@ -393,10 +501,11 @@ def start_attendance():
     except Exception as e:
         return jsonify({"success": False, "message": f"Failed to load model: {str(e)}"}), 500
     
-    # Clear previous session's marked attendance
-    marked_attendance.clear()
+    # Resume (or start) the class session; students already marked stay marked
+    open_attendance_session(class_name)
     
     is_recognition_active = True
+    scheduler.start()
     
     return jsonify({
         "success": True, 
@@ -406,7 +515,7 @@ def start_attendance():
 @app.route("/api/stop-attendance", methods=["POST", "OPTIONS"])
 def stop_attendance():
     """API endpoint to stop attendance recognition"""
-    global attendance_process, is_recognition_active, marked_attendance
+    global attendance_process, is_recognition_active
     
     # Handle preflight request
     if request.method == "OPTIONS":
@@ -415,9 +524,6 @@ def stop_attendance():
     # Stop recognition mode
     is_recognition_active = False
     
-    # Clear marked attendance for next session (optional)
-    # marked_attendance.clear()
-    
     if attendance_process is not None and attendance_process.poll() is None:
         try:
             attendance_process.terminate()
@@ -429,48 +535,102 @@ def stop_attendance():
 
 
 @app.route("/api/video-feed")
-def video_feed():
-    """Video streaming route for the camera feed"""
+@app.route("/api/video-feed/<camera_name>")
+def video_feed(camera_name=DEFAULT_CAMERA):
+    """Video streaming route for a camera feed (default camera if none given).
+
+    Query parameters: tier=low|medium|high, and optionally width, quality,
+    fps and adaptive=0 to override the tier.
+    """
     global is_streaming
+    if camera_name not in cameras:
+        return jsonify({"success": False, "message": f"Unknown camera: {camera_name}"}), 404
+    
+    tier = STREAM_TIERS.get(request.args.get("tier", DEFAULT_STREAM_TIER))
+    if tier is None:
+        return jsonify({"success": False, "message": f"Unknown tier, use one of: {', '.join(STREAM_TIERS)}"}), 400
+    width = request.args.get("width", type=int) or tier["width"]
+    quality = request.args.get("quality", type=int) or tier["quality"]
+    fps = request.args.get("fps", type=int) or tier["fps"]
+    
+    # Coarse steps keep viewers with similar settings sharing encodes; never
+    # wider than the capture, which also bounds the number of encode settings
+    if width is not None:
+        width = max(160, width - width % 32)
+        if width >= cameras[camera_name].width:
+            width = None
+    quality = min(95, max(MIN_JPEG_QUALITY, quality - quality % 5))
+    fps = min(MAX_STREAM_FPS, max(1, fps))
+    adaptive = request.args.get("adaptive", "1") != "0"
+    
     is_streaming = True
-    return Response(generate_frames(),
+    get_camera(camera_name)
+    return Response(generate_frames(camera_name, width, quality, fps, adaptive),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 
+@app.route("/api/cameras")
+def list_cameras():
+    """List configured camera sources"""
+    return jsonify([
+        {
+            "name": name,
+            "source": str(cam.source),
+            "running": cam.running,
+            "feed": f"/api/video-feed/{name}"
+        }
+        for name, cam in cameras.items()
+    ])
+
+
 @app.route("/api/start-camera", methods=["POST", "OPTIONS"])
 def start_camera():
-    """Start camera streaming"""
+    """Start camera streaming (optional JSON {"camera": name}, all cameras otherwise)"""
     global is_streaming
     
     if request.method == "OPTIONS":
         return jsonify({"status": "ok"}), 200
     
+    data = request.get_json(silent=True) or {}
+    camera_name = data.get("camera")
+    if camera_name is not None and camera_name not in cameras:
+        return jsonify({"success": False, "message": f"Unknown camera: {camera_name}"}), 404
+    
     is_streaming = True
-    get_camera()  # Initialize camera
+    get_camera(camera_name)  # Initialize camera(s)
     return jsonify({"success": True, "message": "Camera started"})
 
 
 @app.route("/api/stop-camera", methods=["POST", "OPTIONS"])
 def stop_camera():
-    """Stop camera streaming"""
+    """Stop camera streaming (optional JSON {"camera": name}, all cameras otherwise)"""
     global is_streaming
     
     if request.method == "OPTIONS":
         return jsonify({"status": "ok"}), 200
     
-    is_streaming = False
-    release_camera()
+    data = request.get_json(silent=True) or {}
+    camera_name = data.get("camera")
+    if camera_name is not None and camera_name not in cameras:
+        return jsonify({"success": False, "message": f"Unknown camera: {camera_name}"}), 404
+    
+    release_camera(camera_name)
+    is_streaming = any_camera_running()
     return jsonify({"success": True, "message": "Camera stopped"})
 
 
 @app.route("/api/start-recognition", methods=["POST", "OPTIONS"])
 def start_recognition():
     """Start face recognition mode"""
-    global is_recognition_active, is_streaming, marked_attendance
+    global is_recognition_active, is_streaming
     
     if request.method == "OPTIONS":
         return jsonify({"status": "ok"}), 200
     
+    class_name, error = get_requested_class()
+    if error:
+        return jsonify({"success": False, "message": error}), 400
+    
     # Ensure camera is streaming
     is_streaming = True
     get_camera()
@@ -481,10 +641,11 @@ def start_recognition():
     except Exception as e:
         return jsonify({"success": False, "message": f"Failed to load model: {str(e)}"}), 500
     
-    # Clear previous session's marked attendance
-    marked_attendance.clear()
+    # Resume (or start) the class session; students already marked stay marked
+    open_attendance_session(class_name)
     
     is_recognition_active = True
+    scheduler.start()
     return jsonify({"success": True, "message": "Face recognition started"})
 
 
@@ -507,32 +668,24 @@ def camera_status():
     return jsonify({
         "camera_active": is_streaming,
         "recognition_active": is_recognition_active,
-        "marked_count": len(marked_attendance)
+        "marked_count": attendance_session.marked_count,
+        "session": attendance_session.to_dict(),
+        "cameras": {name: cam.running for name, cam in cameras.items()},
+        "inference": scheduler.stats()
     })
 
 
 @app.route("/api/clear-attendance", methods=["POST", "OPTIONS"])
 def clear_attendance():
     """Clear today's attendance records"""
-    global marked_attendance
-    
     if request.method == "OPTIONS":
         return jsonify({"status": "ok"}), 200
     
     try:
-        # Clear the in-memory marked attendance set
-        marked_attendance.clear()
-        
-        # Optionally clear the CSV file (create backup first)
-        if os.path.exists(ATTENDANCE_CSV):
-            # Create backup
-            backup_path = ATTENDANCE_CSV.replace(".csv", f"_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
-            os.rename(ATTENDANCE_CSV, backup_path)
-            
-            # Create new empty file with header
-            with open(ATTENDANCE_CSV, "w", newline="", encoding="utf-8") as f:
-                writer = csv.writer(f)
-                # Don't write header as original file didn't have one
+        # Move the CSV to a backup and start an empty one; done under the
+        # attendance file lock so other workers notice and drop their marks
+        backup_path = ATTENDANCE_CSV.replace(".csv", f"_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+        attendance_session.clear(backup_path)
         
         return jsonify({
             "success": True,
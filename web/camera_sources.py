@@ -0,0 +1,232 @@
+import threading
+import time
+import cv2
+import numpy as np
+
+from models.insightface_model import detect_faces, align_face, embed_crops
+
+TEST_SOURCE = "test"
+
+
+def parse_camera_sources(spec):
+    """Parse "front=0,back=rtsp://host/stream,demo=test" into {name: source}.
+
+    Digit-only sources are device indices, "test" is the synthetic local
+    source, anything else (RTSP/HTTP URLs, video files) is passed to OpenCV.
+    A source without a name is called "cam<index>" for a device index and
+    "cam<position>" otherwise. Raises ValueError for duplicate names or a
+    spec without any source.
+    """
+    sources = {}
+    for position, item in enumerate(spec.split(",")):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, source = item.partition("=")
+        name, source = name.strip(), source.strip()
+        if not sep:
+            # bare source, e.g. "0" or "rtsp://host/stream"
+            source = name
+            name = f"cam{source}" if source.isdigit() else f"cam{position}"
+        if not name or not source:
+            raise ValueError(f"Invalid camera source entry: {item!r}")
+        if name in sources:
+            raise ValueError(f"Duplicate camera name: {name!r}")
+        sources[name] = int(source) if source.isdigit() else source
+
+    if not sources:
+        raise ValueError("No camera sources configured (set CAMERA_SOURCES, e.g. \"default=0\")")
+    return sources
+
+
+class CameraSource:
+    """A named capture source read continuously by its own thread.
+
+    Consumers never touch the capture device directly; they read the
+    latest frame together with a sequence number that increases on every
+    new frame, so they can tell whether they have already seen it.
+    """
+
+    def __init__(self, name, source, width=640, height=480):
+        self.name = name
+        self.source = source
+        self.width = width
+        self.height = height
+        self._lock = threading.Lock()
+        self._frame = None
+        self._seq = 0
+        # Stop flag of the current run; each start() gets a fresh one so a
+        # thread still stuck in read() after stop() can't touch a newer run
+        self._stop_event = None
+
+    @property
+    def running(self):
+        stop_event = self._stop_event
+        return stop_event is not None and not stop_event.is_set()
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            stop_event = threading.Event()
+            self._stop_event = stop_event
+            self._frame = None
+        thread = threading.Thread(target=self._run, args=(stop_event,), name=f"camera-{self.name}", daemon=True)
+        thread.start()
+
+    def stop(self):
+        with self._lock:
+            stop_event = self._stop_event
+            self._stop_event = None
+            self._frame = None
+        if stop_event is not None:
+            # The thread notices on its next frame and releases its own capture
+            stop_event.set()
+
+    def read(self):
+        """Return (seq, frame) for the latest captured frame"""
+        with self._lock:
+            return self._seq, self._frame
+
+    def _open(self):
+        if self.source == TEST_SOURCE:
+            return None
+        capture = cv2.VideoCapture(self.source)
+        capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        return capture
+
+    def _test_frame(self):
+        # Moving bar on a dark background, paced like a 30 FPS camera
+        time.sleep(0.033)
+        frame = np.full((self.height, self.width, 3), 40, dtype=np.uint8)
+        x = (self._seq * 8) % self.width
+        cv2.rectangle(frame, (x, 0), (min(x + 40, self.width - 1), self.height - 1), (200, 200, 200), -1)
+        cv2.putText(frame, f"TEST SOURCE: {self.name}", (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        return True, frame
+
+    def _run(self, stop_event):
+        capture = self._open()
+        try:
+            while not stop_event.is_set():
+                if capture is None:
+                    success, frame = self._test_frame()
+                else:
+                    success, frame = capture.read()
+
+                if not success:
+                    # Files end and network streams drop; stop this source only
+                    print(f"Camera '{self.name}' stopped delivering frames")
+                    break
+
+                with self._lock:
+                    if stop_event.is_set():
+                        break
+                    self._frame = frame
+                    self._seq += 1
+        finally:
+            if capture is not None:
+                capture.release()
+            # Only ends this run; a newer start() has its own event
+            stop_event.set()
+
+
+class InferenceScheduler:
+    """Single inference thread shared by all camera sources.
+
+    Each round it takes the newest unseen frame from every running camera,
+    runs detection per frame and then one batched recognition pass over all
+    faces from all cameras, so adding a camera does not add a model copy.
+    Results are handed to `on_face(camera_name, bbox, embedding)` which
+    returns the (label, color) drawn on that camera's preview.
+    """
+
+    def __init__(self, cameras, get_model, on_face, is_active, idle_sleep=0.01):
+        self.cameras = cameras
+        self.get_model = get_model
+        self.on_face = on_face
+        self.is_active = is_active
+        self.idle_sleep = idle_sleep
+        self._annotations = {}
+        self._last_seq = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = 0
+        self.frames = 0
+        self.faces = 0
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+        self._thread.start()
+
+    def annotations(self, camera_name):
+        """Latest (bbox, label, color) list for a camera"""
+        with self._lock:
+            return self._annotations.get(camera_name, [])
+
+    def clear(self):
+        with self._lock:
+            self._annotations.clear()
+
+    def stats(self):
+        return {"batches": self.batches, "frames": self.frames, "faces": self.faces}
+
+    def _collect(self):
+        batch = []
+        for name, cam in list(self.cameras.items()):
+            if not cam.running:
+                continue
+            seq, frame = cam.read()
+            if frame is None or self._last_seq.get(name) == seq:
+                continue
+            self._last_seq[name] = seq
+            batch.append((name, frame))
+        return batch
+
+    def _process(self, batch):
+        model = self.get_model()
+        crops = []
+        owners = []
+
+        for name, frame in batch:
+            bboxes, kpss = detect_faces(model, frame)
+            if kpss is None:
+                continue
+            for bbox, kps in zip(bboxes, kpss):
+                crops.append(align_face(frame, kps))
+                owners.append((name, bbox[:4].astype(int)))
+
+        embeddings = embed_crops(model, crops)
+
+        results = {name: [] for name, _ in batch}
+        for (name, bbox), emb in zip(owners, embeddings):
+            label, color = self.on_face(name, bbox, emb)
+            results[name].append((bbox, label, color))
+
+        with self._lock:
+            self._annotations.update(results)
+
+        self.batches += 1
+        self.frames += len(batch)
+        self.faces += len(crops)
+
+    def _run(self):
+        while True:
+            if not self.is_active():
+                self.clear()
+                time.sleep(0.1)
+                continue
+
+            batch = self._collect()
+            if not batch:
+                time.sleep(self.idle_sleep)
+                continue
+
+            try:
+                self._process(batch)
+            except Exception as e:
+                print(f"Face recognition error: {e}")
+                time.sleep(0.1)